@@ -1,6 +1,8 @@
 import json
 import logging
 import os
+import threading
+import time
 
 from ulauncher.api.client.EventListener import EventListener
 from ulauncher.api.client.Extension import Extension
@@ -16,33 +18,141 @@ from typing import List
 import sqlite3
 import tempfile
 import shutil
+import pathlib
 import configparser
+import importlib.util
+import re
+import heapq
+from itertools import compress
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# numba and numpy take a few hundred ms to import, so they are only looked up here
+# and imported once an index is big enough to use them, see BookmarksIndex
+numba_available = importlib.util.find_spec('numba') is not None and importlib.util.find_spec('numpy') is not None
+compiled_scan_packed = None
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
 
+def scan_packed(buf, offsets, patterns, pattern_offsets, out):
+    # writes the indexes of titles containing every pattern into out, returns how many
+    count = 0
+    for i in range(len(offsets) - 1):
+        start = offsets[i]
+        end = offsets[i + 1]
+        matched = True
+        for p in range(len(pattern_offsets) - 1):
+            pattern_start = pattern_offsets[p]
+            pattern_len = pattern_offsets[p + 1] - pattern_start
+            found = False
+            for j in range(start, end - pattern_len + 1):
+                k = 0
+                while k < pattern_len and buf[j + k] == patterns[pattern_start + k]:
+                    k += 1
+                if k == pattern_len:
+                    found = True
+                    break
+            if not found:
+                matched = False
+                break
+        if matched:
+            out[count] = i
+            count += 1
+            if count == len(out):
+                break
+    return count
+
+def get_compiled_scan_packed():
+    # first call compiles (cached on disk afterwards)
+    global compiled_scan_packed
+    if compiled_scan_packed is None:
+        from numba import njit
+        compiled_scan_packed = njit(cache=True)(scan_packed)
+    return compiled_scan_packed
+
+def disable_numba(error: Exception) -> None:
+    # fall back to the pure python matcher for the rest of the session
+    global numba_available
+    if numba_available:
+        numba_available = False
+        logger.warning(f"numba is unusable, falling back to the python matcher: {error}")
+
+def pack_strings(strings):
+    # utf-8 encoded back to back plus int32 boundaries; utf-8 keeps substring matches intact
+    import numpy as np
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int32)
+    np.cumsum([len(data) for data in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
 class BookmarksHandler(ABC):
-    def __init__(self, name, path, image, max_matches_len):
+    def __init__(self, name, path, image):
         super().__init__()
         self.active = True
         self.name = name
         self.path = path
         self.image = image
-        self.max_matches_len = max_matches_len
-        self.matches_len = 0
 
     def set_active(self, isActive: bool):
         self.active = isActive
 
     @staticmethod
-    def contains_all_substrings(text, substrings):
-        for substring in substrings:
-            if substring.lower() not in text.lower():
-                return False
-        return True
+    def split_query(query: str) -> List[str]:
+        # lowered once per query instead of once per bookmark
+        return [sub_query.lower() for sub_query in query.split()]
+
+    @staticmethod
+    def build_matcher(substrings):
+        # returns a predicate on lowered text that is true when it contains all substrings
+        unique_substrings = set(substrings)
+        if ahocorasick is not None and unique_substrings:
+            automaton = ahocorasick.Automaton()
+            for substring in unique_substrings:
+                automaton.add_word(substring, substring)
+            automaton.make_automaton()
+            substrings_len = len(unique_substrings)
+            return lambda text: len({found for _, found in automaton.iter(text)}) == substrings_len
+        # one lookahead per substring, so overlapping substrings are all checked
+        lookaheads = ''.join(f'(?=.*{re.escape(substring)})' for substring in unique_substrings)
+        return re.compile(lookaheads, re.DOTALL).match
+
+    @staticmethod
+    def score(lowered_name: str, substrings: List[str]) -> float:
+        # the earlier the first word shows up in the title, the better
+        if not substrings:
+            return 0.0
+        return -float(lowered_name.find(substrings[0]))
+
+    @staticmethod
+    def file_version(path: str) -> int|None:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
 
     @abstractmethod
-    def get_bookmarks(self, query:str) -> List[ExtensionResultItem]:
+    def version(self) -> tuple:
+        # cheap stat based key, the index is rebuilt from iter_entries whenever it changes
+        pass
+
+    @abstractmethod
+    def iter_entries(self):
+        # yields (name, url, last_used) with last_used in microseconds since the unix epoch
+        pass
+
+    def reload(self) -> None:
+        # called before iter_entries when version changed, drops state tied to the old data
         pass
 
     @abstractmethod
@@ -51,19 +161,70 @@ class BookmarksHandler(ABC):
 
 # adapted from https://github.com/KuenzelIT/ulauncher-firefox-bookmarks/tree/master
 class FirefoxBookmarksHandler(BookmarksHandler):
-    def __init__(self, name, path, image, max_matches_len):
-        super().__init__(name, path, image, max_matches_len) # TODO: make it possible to NOT have it
+    profile_cache_lock = threading.Lock()
+
+    def __init__(self, name, path, image):
+        super().__init__(name, path, image) # TODO: make it possible to NOT have it
+        self.conn = None
+        self._tmp_path = None
+        self._places_path = None
+        self._opened = False
+        #   No ORDER BY, BookmarksIndex sorts the rows of all browsers by last use anyway
+        self._stmt_all = self.build_select()
+
+    def _ensure_open(self):
+        #   Deferred to the first active query, so a disabled browser never touches its DB
+        if self._opened:
+            return
+        self._opened = True
         history_location = self.search_places()
         if history_location is None:
-            logger.log(f"History location not found at {path} for browser {name}.")
+            logger.info(f"History location not found at {self.path} for browser {self.name}.")
             return
-        temporary_history_location = tempfile.mktemp()
-        shutil.copyfile(history_location, temporary_history_location) # because DB is locked while firefox is open
+        self._places_path = history_location
         #   Open Firefox history database
-        self.conn = sqlite3.connect(temporary_history_location)
+        self.conn = self.connect(history_location)
+        if self.conn is None:
+            return
         #   External functions
         self.conn.create_function('hostname', 1 ,self.__getHostname)
 
+    @staticmethod
+    def is_busy_error(error: sqlite3.DatabaseError) -> bool:
+        code = getattr(error, 'sqlite_errorcode', None)
+        if code is not None:
+            return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+        message = str(error)
+        return 'locked' in message or 'busy' in message
+
+    def connect(self, history_location: str) -> sqlite3.Connection|None:
+        if not os.path.exists(history_location):
+            logger.info(f"{history_location} does not exist for browser {self.name}.")
+            return None
+        #   Read the live DB in place; immutable=1 skips locking, so it works while firefox is open
+        uri = f"{pathlib.Path(history_location).as_uri()}?mode=ro&immutable=1"
+        conn = None
+        try:
+            # queries run on the extension's worker threads, one at a time per handler
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            conn.execute("SELECT 1 FROM moz_bookmarks LIMIT 1")
+            return conn
+        except sqlite3.DatabaseError as e:
+            if conn is not None:
+                conn.close()
+            if not FirefoxBookmarksHandler.is_busy_error(e):
+                logger.warning(f"Could not open {history_location}: {e}")
+                return None
+            logger.info(f"Could not open {history_location} in place ({e}), reading a copy instead.")
+        with tempfile.NamedTemporaryFile(prefix="places-", suffix=".sqlite", delete=False) as tmp:
+            self._tmp_path = tmp.name
+        try:
+            shutil.copyfile(history_location, self._tmp_path)
+            return sqlite3.connect(self._tmp_path, check_same_thread=False)
+        except (OSError, sqlite3.Error):
+            self.remove_tmp()
+            raise
+
     #   Get hostname from url
     def __getHostname(self,str):
         url = str.split('/')
@@ -85,147 +246,264 @@ class FirefoxBookmarksHandler(BookmarksHandler):
         # TODO: make isRelative=0 possible
         return profile_config.get("Profile0", "Path") 
 
+    @staticmethod
+    def profile_cache_path() -> str:
+        cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        return os.path.join(cache_home, 'ulauncher-browser-bookmarks', 'firefox-profiles.json')
+
+    @staticmethod
+    def read_default_profile_path(conf_path: str) -> str:
+        #   Remembered across restarts until profiles.ini changes. Both firefox handlers share
+        #   the cache file and run on the executor, so the read-modify-write is serialized.
+        with FirefoxBookmarksHandler.profile_cache_lock:
+            mtime = os.stat(conf_path).st_mtime_ns
+            cache_path = FirefoxBookmarksHandler.profile_cache_path()
+            try:
+                with open(cache_path) as cache_file:
+                    cached = json.load(cache_file)
+            except (OSError, ValueError):
+                cached = {}
+            entry = cached.get(conf_path)
+            if isinstance(entry, dict) and entry.get('mtime') == mtime:
+                return entry['path']
+            #   Profile config parse
+            profile_config = configparser.RawConfigParser()
+            profile_config.read(conf_path)
+            prof_path = FirefoxBookmarksHandler.get_default_profile_path(profile_config)
+            cached[conf_path] = {'mtime': mtime, 'path': prof_path}
+            FirefoxBookmarksHandler.write_profile_cache(cache_path, cached)
+            return prof_path
+
+    @staticmethod
+    def write_profile_cache(cache_path: str, cached: dict):
+        tmp_name = None
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(cache_path), delete=False) as tmp:
+                tmp_name = tmp.name
+                json.dump(cached, tmp)
+            os.replace(tmp_name, cache_path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.debug(f"Could not write {cache_path}: {e}")
+            if tmp_name is not None:
+                try:
+                    os.unlink(tmp_name)
+                except OSError:
+                    pass
+
     def search_places(self) -> str|None:
-        #   Firefox folder path
-        firefox_path = os.path.join(os.environ['HOME'], self.path + "/")
+        #   Firefox folder path, snap firefox is configured with an absolute one
+        firefox_path = self.path if os.path.isabs(self.path) else os.path.join(os.path.expanduser('~'), self.path)
         #   Firefox profiles configuration file path
-        if not os.path.exists(firefox_path):
-            return None
         conf_path = os.path.join(firefox_path,'profiles.ini')
-        #   Profile config parse
-        profile_config = configparser.RawConfigParser()
-        profile_config.read(conf_path)
-        prof_path = FirefoxBookmarksHandler.get_default_profile_path(profile_config)
+        if not os.path.exists(conf_path):
+            return None
+        prof_path = FirefoxBookmarksHandler.read_default_profile_path(conf_path)
         #   Sqlite db directory path
         sql_path = os.path.join(firefox_path,prof_path)
         #   Sqlite db path
         return os.path.join(sql_path,'places.sqlite')
 
-    def fetch_rows(self, query: str):
+    @staticmethod
+    def build_select() -> str:
         # depth 1
-        order_by = "A.lastModified DESC" if query == "" else f'instr(LOWER(A.title), LOWER("{query}")) ASC, A.lastModified DESC'
-        sql_query = f'''
+        return '''
         SELECT 
             A.title, 
             url, 
             CASE
                 WHEN p.title = 'toolbar' THEN A.title
                 ELSE COALESCE(p.title || '/', '') || A.title
-            END AS full_title
+            END AS full_title,
+            A.lastModified
         FROM moz_bookmarks AS A
         LEFT JOIN moz_bookmarks AS p
             ON A.parent = p.id AND p.type = 2
         JOIN moz_places AS B 
             ON(A.fk = B.id)
-        WHERE full_title LIKE "%{query}%"
-        ORDER BY {order_by}
-        LIMIT {self.max_matches_len}
+        WHERE full_title IS NOT NULL
         '''
 
-        cursor = self.conn.cursor()
-        logger.debug(f"{sql_query=}")
-        cursor.execute(sql_query)
-        rows = cursor.fetchall()
-        return rows
+    def remove_tmp(self):
+        #   The copy can be as big as places.sqlite itself, don't leave it behind in /tmp
+        if self._tmp_path is None:
+            return
+        try:
+            os.unlink(self._tmp_path)
+        except OSError as e:
+            logger.warning(f"Could not remove {self._tmp_path}: {e}")
+        self._tmp_path = None
 
     def close(self):
         if self.conn is not None:
             self.conn.close()
-
-    def get_bookmarks(self, query: str) -> List[ExtensionResultItem]:
-        if query is None:
-            query = ''
-        items = []
+            self.conn = None
+        self.remove_tmp()
+
+    def version(self) -> tuple:
+        self._ensure_open()
+        if self._places_path is None:
+            return ()
+        #   Only places.sqlite itself: the -wal file changes on nearly every page visit,
+        #   and neither the immutable connection nor the copy reads it anyway
+        return (BookmarksHandler.file_version(self._places_path),)
+
+    def reload(self) -> None:
+        #   The immutable connection (or the copy) never sees newer data, open it again
+        self.close()
+        self._opened = False
+
+    def iter_entries(self):
+        self._ensure_open()
         if self.conn is None:
-            return items
-        if not self.active:
-            return items
-        rows = self.fetch_rows(query)
-        for link in rows:
-            full_title = link[2]
-            if full_title.startswith("toolbar/"):
-                full_title = full_title[len("toolbar/"):]
-            # TODO: favicon of the website
-            #icons are found in table moz_favicons .data and .mime_type
-            title = link[0]
-            url = link[1]
-            items.append(ExtensionResultItem(icon=self.image,
-                                            name=full_title,
-                                            description=url,
-                                            on_enter=OpenUrlAction(url)))
-        return items
+            return
+        # the toolbar folder is already left out of full_title by the CASE in build_select
+        # TODO: favicon of the website
+        #icons are found in table moz_favicons .data and .mime_type
+        try:
+            rows = self.conn.execute(self._stmt_all).fetchall()
+        except sqlite3.DatabaseError as e:
+            #   Read in place without locks, firefox may be checkpointing into the file right now.
+            #   Retried once places.sqlite changes again.
+            logger.warning(f"Could not read bookmarks from {self._places_path}: {e}")
+            return
+        for title, url, full_title, last_modified in rows:
+            yield full_title, url, last_modified or 0
 
 class ChromiumBookmarksHandler(BookmarksHandler):
-    def __init__(self, name, path, image, max_matches_len):
-        super().__init__(name, path, image, max_matches_len)
-        self.bookmark_paths = self.get_bookmark_paths()
+    # Chromium timestamps count microseconds since 1601-01-01
+    epoch_delta_us = 11644473600 * 1000000
+
+    def __init__(self, name, path, image):
+        super().__init__(name, path, image)
+        self.bookmark_paths = None
+        # Bookmarks path -> (st_mtime_ns, [(name, url, last_used)]); Chromium only rewrites the file on edits
+        self._cache: dict[str, tuple[int, List[tuple[str, str, int]]]] = {}
     
     def get_bookmark_paths(self) -> List[str]:
-        f = os.popen(f'find $HOME/{self.path} | grep Bookmarks')
-        res = f.read().split('\n')
         res_lst = []
-        if len(res) == 0:
+        for root, dirs, files in os.walk(os.path.expanduser(f'~/{self.path}')):
+            # profile caches never hold a Bookmarks file but can be huge
+            dirs[:] = [d for d in dirs if d != 'Cache']
+            if 'Bookmarks' in files:
+                res_lst.append(os.path.join(root, 'Bookmarks'))
+        if len(res_lst) == 0:
             logger.info(f'Path to the {self.name} Bookmarks was not found')
-            return res_lst
-        for one_path in res:
-            if one_path.endswith('Bookmarks'):
-                res_lst.append(one_path)
         return res_lst
 
-    def find_rec(self, bookmark_entry, query, matches):
-        if self.matches_len >= self.max_matches_len:
-            return
-
-        if bookmark_entry['type'] == 'folder':
-            for child_bookmark_entry in bookmark_entry['children']:
-                self.find_rec(child_bookmark_entry, query, matches)
-        else:
-            sub_queries = query.split(' ')
-            bookmark_title = bookmark_entry['name']
-
-            if not BookmarksHandler.contains_all_substrings(bookmark_title, sub_queries):
-                return
-
-            matches.append(bookmark_entry)
-            self.matches_len += 1
-
-    def get_bookmarks(self, query: str) -> List[ExtensionResultItem]:
-        items = []
-        if not self.active:
-            return items
-        self.matches_len = 0
-
-        if query is None:
-            query = ''
-
-        logger.debug(f'Finding bookmark entries for {query=}')
+    def _ensure_open(self):
+        # the profile directories are only walked once the browser is searched
+        if self.bookmark_paths is None:
+            self.bookmark_paths = self.get_bookmark_paths()
 
-        if len(self.bookmark_paths) == 0:
-            return []
+    @staticmethod
+    def collect_url_entries(bookmark_entry, entries):
+        # explicit stack instead of recursion, children are pushed reversed to keep the folder order
+        pending = [bookmark_entry]
+        while pending:
+            bookmark_entry = pending.pop()
+            if bookmark_entry['type'] == 'folder':
+                pending.extend(reversed(bookmark_entry['children']))
+            else:
+                entries.append(bookmark_entry)
 
+    @staticmethod
+    def last_used(bookmark_entry) -> int:
+        chromium_time = max(int(bookmark_entry.get('date_added') or 0),
+                            int(bookmark_entry.get('date_last_used') or 0))
+        return max(chromium_time - ChromiumBookmarksHandler.epoch_delta_us, 0)
+
+    def load_bookmarks(self, bookmarks_path, mtime) -> List[tuple[str, str, int]]:
+        cached = self._cache.get(bookmarks_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        logger.debug(f'Loading {bookmarks_path}')
+        entries = []
+        # read as bytes so orjson parses the utf-8 directly instead of decoding to str first
+        with open(bookmarks_path, 'rb') as data_file:
+            data = orjson.loads(data_file.read()) if orjson is not None else json.load(data_file)
+        for root in ('bookmark_bar', 'synced', 'other'):
+            if root in data['roots']:
+                ChromiumBookmarksHandler.collect_url_entries(data['roots'][root], entries)
+        last_used = ChromiumBookmarksHandler.last_used
+        bookmarks = [(entry['name'], entry['url'], last_used(entry)) for entry in entries]
+        self._cache[bookmarks_path] = (mtime, bookmarks)
+        return bookmarks
+
+    def version(self) -> tuple:
+        self._ensure_open()
+        return tuple(BookmarksHandler.file_version(path) for path in self.bookmark_paths)
+
+    def iter_entries(self):
+        self._ensure_open()
         for bookmarks_path in self.bookmark_paths:
-            matches = []
-            with open(bookmarks_path) as data_file:
-                data = json.load(data_file)
-                self.find_rec(data['roots']['bookmark_bar'], query, matches)
-                self.find_rec(data['roots']['synced'], query, matches)
-                self.find_rec(data['roots']['other'], query, matches)
-
-            for bookmark in matches:
-                bookmark_name = bookmark['name'].encode('utf-8')
-                bookmark_url = bookmark['url'].encode('utf-8')
-                item = ExtensionResultItem(
-                    icon=self.image,
-                    name='%s' % bookmark_name.decode('utf-8'),
-                    description='%s' % bookmark_url.decode('utf-8'),
-                    on_enter=OpenUrlAction(bookmark_url.decode('utf-8'))
-                )
-                items.append(item)
-        return items
+            mtime = BookmarksHandler.file_version(bookmarks_path)
+            if mtime is None:
+                continue
+            yield from self.load_bookmarks(bookmarks_path, mtime)
 
     def close(self) -> None:
         pass
 
+class BookmarksIndex:
+    # bookmarks of all searched browsers in one set of parallel lists, most recently used first
+
+    # below this many titles the compiled matcher is faster than numba's import and call overhead
+    packed_scan_min_len = 10000
+
+    def __init__(self, handler_rows):
+        # handler_rows: one list per browser from load_rows, each already sorted
+        rows = list(heapq.merge(*handler_rows, key=itemgetter(4), reverse=True))
+        self.names = [row[0] for row in rows]
+        self.lowered = [row[1] for row in rows]
+        self.urls = [row[2] for row in rows]
+        self.images = [row[3] for row in rows]
+        self.packed = None
+        if numba_available and len(self.lowered) >= BookmarksIndex.packed_scan_min_len:
+            try:
+                self.packed = pack_strings(self.lowered)
+            except Exception as e:
+                disable_numba(e)
+
+    @staticmethod
+    def load_rows(handler: BookmarksHandler) -> List[tuple[str, str, str, str, int]]:
+        # (name, lowered name, url, image, last_used), most recently used first;
+        # untitled entries can't match anything and must not break the whole index
+        image = handler.image
+        rows = [(name, name.lower(), url, image, last_used)
+                for name, url, last_used in handler.iter_entries() if name]
+        rows.sort(key=itemgetter(4), reverse=True)
+        return rows
+
+    def find_packed(self, sub_queries) -> List[int]:
+        import numpy as np
+        buf, offsets = self.packed
+        patterns, pattern_offsets = pack_strings(sub_queries)
+        out = np.empty(len(self.lowered), dtype=np.int32)
+        count = get_compiled_scan_packed()(buf, offsets, patterns, pattern_offsets, out)
+        return out[:count].tolist()
+
+    def search(self, query: str, max_matches_len: int) -> List[int]:
+        # indexes of the best max_matches_len matches; equal scores keep the recency order
+        sub_queries = BookmarksHandler.split_query(query)
+        lowered = self.lowered
+        if not sub_queries:
+            return list(range(min(max_matches_len, len(lowered))))
+        matched = None
+        if self.packed is not None:
+            try:
+                matched = self.find_packed(sub_queries)
+            except Exception as e:
+                # an installed but broken numba/numpy only shows up here, on import or compile
+                disable_numba(e)
+                self.packed = None
+        if matched is None:
+            matcher = BookmarksHandler.build_matcher(sub_queries)
+            matched = compress(range(len(lowered)), map(matcher, lowered))
+        score = BookmarksHandler.score
+        return heapq.nlargest(max_matches_len, matched, key=lambda i: score(lowered[i], sub_queries))
+
 support_browsers = {
     "chrome": {
         "name": "Google",
@@ -281,6 +559,8 @@ class SystemExitEventListener(EventListener):
 
 class BrowserBookmarks(Extension):
     max_matches_len = 10
+    # how long results of an unchanged query are reused before searching the index again
+    repeated_query_ttl = 1.0
 
     def get_bookmark_browser_handlers(self) -> List[BookmarksHandler]:
         bookmark_browser_handlers = {}
@@ -288,37 +568,92 @@ class BrowserBookmarks(Extension):
             handler: BookmarksHandler = browser_obj["handler"](
                 name=browser_obj["name"],
                 path=browser_obj["path"],
-                image=browser_obj["image"],
-                max_matches_len=self.max_matches_len
+                image=browser_obj["image"]
             )
             bookmark_browser_handlers[browser_key] = handler
         return bookmark_browser_handlers
 
     def set_pref(self, pref_name, pref_value):
-        if pref_name.startswith("search_"):
-            targetBrowser = pref_name[len("search_"):]
-            targetValue = (pref_value == "yes")
-            self.bookmark_browser_handlers[targetBrowser].set_active(targetValue)
-        else:
-            if pref_name == "firefox_profile":
-                pass # TODO: implement
+        with self._lock:
+            self.forget_last_query()
+            if pref_name.startswith("search_"):
+                targetBrowser = pref_name[len("search_"):]
+                targetValue = (pref_value == "yes")
+                self.bookmark_browser_handlers[targetBrowser].set_active(targetValue)
+            else:
+                if pref_name == "firefox_profile":
+                    pass # TODO: implement
 
     def __init__(self):
         super(BrowserBookmarks, self).__init__()
         self.bookmark_browser_handlers = self.get_bookmark_browser_handlers()
+        # kept for the extension lifetime so keystrokes don't pay for thread creation
+        self.executor = ThreadPoolExecutor(max_workers=len(self.bookmark_browser_handlers))
+        # guards the index, the handlers' connections and the _last_* state against overlapping events
+        self._lock = threading.Lock()
+        self._index = None
+        self._index_versions = None
+        # rows and version each handler was last loaded at, kept while a browser is disabled
+        self._loaded_rows = {}
+        self._loaded_versions = {}
+        self.forget_last_query()
         self.subscribe(PreferencesEvent, PreferencesEventListener())
         self.subscribe(PreferencesUpdateEvent,PreferencesUpdateEventListener())
         self.subscribe(KeywordQueryEvent, KeywordQueryEventListener())
         self.subscribe(SystemExitEvent,SystemExitEventListener())
 
     def cleanup(self):
-        for browser_key, handler in self.bookmark_browser_handlers.items():
-            handler.close()
+        with self._lock:
+            self.executor.shutdown(wait=True)
+            for browser_key, handler in self.bookmark_browser_handlers.items():
+                handler.close()
 
-    def get_final_items(self, query: str):
-        final_items = []
-        for browser_key, handler in self.bookmark_browser_handlers.items():
-            final_items += handler.get_bookmarks(query)
-        # TODO: reorder and limit
-        return final_items[:self.max_matches_len]
+    def forget_last_query(self):
+        self._last_query = None
+        self._last_query_time = 0.0
+        self._last_items = []
 
+    def get_final_items(self, query: str):
+        # query_debounce in the manifest already drops intermediate keystrokes,
+        # this skips the handlers when the very same query is sent again
+        with self._lock:
+            now = time.monotonic()
+            if query == self._last_query and now - self._last_query_time < self.repeated_query_ttl:
+                return self._last_items
+            final_items = self.search_index(query)
+            self._last_query = query
+            self._last_query_time = now
+            self._last_items = final_items
+            return final_items
+
+    def get_index(self) -> BookmarksIndex:
+        # rebuilt only when the searched browsers or one of their bookmark files changed;
+        # callers hold self._lock, see get_final_items
+        active_handlers = {key: handler for key, handler in self.bookmark_browser_handlers.items() if handler.active}
+        versions = dict(zip(active_handlers, self.executor.map(lambda handler: handler.version(),
+                                                               active_handlers.values())))
+        if self._index is not None and versions == self._index_versions:
+            return self._index
+        # only browsers whose data changed (or that were never loaded) are read again
+        stale_keys = [key for key in active_handlers
+                      if key not in self._loaded_rows or self._loaded_versions[key] != versions[key]]
+        for key in stale_keys:
+            if key in self._loaded_rows:
+                active_handlers[key].reload()
+        # sqlite and file reads release the GIL, so the browsers are loaded concurrently
+        results = self.executor.map(lambda key: BookmarksIndex.load_rows(active_handlers[key]), stale_keys)
+        for key, rows in zip(stale_keys, results):
+            self._loaded_rows[key] = rows
+            self._loaded_versions[key] = versions[key]
+        self._index = BookmarksIndex([self._loaded_rows[key] for key in active_handlers])
+        self._index_versions = versions
+        return self._index
+
+    def search_index(self, query: str):
+        if query is None:
+            query = ''
+        index = self.get_index()
+        item, action = ExtensionResultItem, OpenUrlAction
+        names, urls, images = index.names, index.urls, index.images
+        return [item(icon=images[i], name=names[i], description=urls[i], on_enter=action(urls[i]))
+                for i in index.search(query, self.max_matches_len)]